@@ -38,6 +38,7 @@ class DatabaseConfig:
     # Connection settings
     timeout: float = 30.0
     enable_wal_mode: bool = True
+    synchronous: str = "NORMAL"  # OFF, NORMAL, FULL, EXTRA
     
     # Timestamp conversion
     ms_per_second: int = 1000
@@ -4,8 +4,10 @@ from datetime import date
 from pathlib import Path
 from typing import List, Dict, Any, Optional, TYPE_CHECKING
 
-from sqlalchemy import create_engine, and_
+from sqlalchemy import create_engine, event, and_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import StaticPool
 
 from .models import Base, TimeSeries, Activity, DailyHealthMetric, SyncStatus, MetricType
 
@@ -15,6 +17,9 @@ else:
     DatabaseConfig = None
 
 
+SQLITE_SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
 def _get_default_config() -> 'DatabaseConfig':
     """Get default database configuration."""
     if DatabaseConfig is None:
@@ -38,11 +43,39 @@ class HealthDB:
         self.db_path = db_path
         self.config = config if config is not None else _get_default_config()
         
-        self.engine = create_engine(f"sqlite:///{db_path}")
+        connect_args = {"timeout": self.config.timeout}
+        engine_options = {}
+        if str(db_path) == ":memory:":
+            # Pin one connection so the in-memory database outlives sessions
+            connect_args["check_same_thread"] = False
+            engine_options["poolclass"] = StaticPool
+        
+        self.engine = create_engine(
+            f"sqlite:///{db_path}",
+            connect_args=connect_args,
+            **engine_options
+        )
+        event.listen(self.engine, "connect", self._configure_connection)
         self.SessionLocal = sessionmaker(bind=self.engine)
         
         Base.metadata.create_all(self.engine)
     
+    def _configure_connection(self, dbapi_connection, connection_record):
+        """Apply SQLite PRAGMAs to each new connection."""
+        synchronous = self.config.synchronous.upper()
+        if synchronous not in SQLITE_SYNCHRONOUS_MODES:
+            raise ValueError(
+                f"Invalid synchronous mode: {self.config.synchronous}. "
+                f"Expected one of: {', '.join(sorted(SQLITE_SYNCHRONOUS_MODES))}"
+            )
+        
+        cursor = dbapi_connection.cursor()
+        if self.config.enable_wal_mode:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+    
     def get_session(self) -> Session:
         """Get database session."""
         return self.SessionLocal()
@@ -65,16 +98,28 @@ class HealthDB:
     
     def store_timeseries_batch(self, user_id: int, metric_type: MetricType, data: List[tuple]):
         """Store batch of timeseries data."""
+        if not data:
+            return
+        
+        rows = [
+            {
+                'user_id': user_id,
+                'metric_type': metric_type.value,
+                'timestamp': timestamp,
+                'value': value,
+                'meta_data': metadata
+            }
+            for timestamp, value, metadata in data
+        ]
+        
+        # Single executemany upsert instead of a per-row ORM merge
+        stmt = sqlite_insert(TimeSeries)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'metric_type', 'timestamp'],
+            set_={'value': stmt.excluded.value, 'meta_data': stmt.excluded.meta_data}
+        )
         with self.get_session() as session:
-            for timestamp, value, metadata in data:
-                timeseries = TimeSeries(
-                    user_id=user_id,
-                    metric_type=metric_type.value,
-                    timestamp=timestamp,
-                    value=value,
-                    meta_data=metadata
-                )
-                session.merge(timeseries)
+            session.execute(stmt, rows)
             session.commit()
     
     def store_activity(self, user_id: int, activity_data: Dict[str, Any]):
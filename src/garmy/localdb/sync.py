@@ -209,13 +209,17 @@ class SyncManager:
                 stats['completed'] += 1
 
             # Update sync status for the entire ACTIVITIES metric for this date
-            self.db.update_sync_status(user_id, sync_date, MetricType.ACTIVITIES, 'completed')
+            self._update_activity_status(user_id, sync_date)
             self.progress.task_complete("activities", sync_date)
 
         except Exception as e:
             self.progress.task_failed("activities", sync_date)
             stats['failed'] += 1
 
+    def _update_activity_status(self, user_id: int, sync_date: date):
+        """Mark the ACTIVITIES metric as completed for a date."""
+        self.db.update_sync_status(user_id, sync_date, MetricType.ACTIVITIES, 'completed')
+
     def _store_health_metric(self, user_id: int, sync_date: date, metric_type: MetricType, data: Dict):
         """Store health metric data in normalized table."""
         if metric_type == MetricType.DAILY_SUMMARY:
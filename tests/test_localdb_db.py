@@ -1,67 +1,209 @@
 
-from datetime import date, datetime
+from datetime import date, datetime, timezone
 from pathlib import Path
-from unittest.mock import MagicMock, patch
+from types import SimpleNamespace
+from unittest.mock import patch
 
 import pytest
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, func, insert, select, text
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
 
+from garmy.localdb.config import DatabaseConfig, LocalDBConfig
 from garmy.localdb.db import HealthDB
 from garmy.localdb.models import Base, TimeSeries, Activity, DailyHealthMetric, SyncStatus, MetricType
+from garmy.localdb.progress import ProgressReporter
+from garmy.localdb.sync import SyncManager
+
+# Durability is irrelevant for throwaway test databases.
+TEST_DB_CONFIG = DatabaseConfig(synchronous="OFF")
+
+TS_2023_01_01_12_00 = int(datetime(2023, 1, 1, 12, 0, 0, tzinfo=timezone.utc).timestamp())
+TS_2023_01_01_12_01 = int(datetime(2023, 1, 1, 12, 1, 0, tzinfo=timezone.utc).timestamp())
+
+
+def _enable_savepoints(engine) -> None:
+    """Let SQLAlchemy drive transactions so SAVEPOINTs work with pysqlite."""
+
+    @event.listens_for(engine, "connect")
+    def _disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def _emit_begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+    # Drop connections opened by create_all so the listeners apply to all;
+    # this discards an in-memory database, so the schema is rebuilt.
+    engine.dispose()
+    Base.metadata.create_all(engine)
+
+
+def _seed(health_db: HealthDB, *ops) -> None:
+    """Insert rows for several models in a single transaction.
+
+    Each op is a ``(Model, rows)`` pair where rows is a list of column dicts.
+    """
+    with health_db.get_session() as session:
+        for model, rows in ops:
+            session.execute(insert(model), rows)
+        session.commit()
+
+
+@pytest.fixture(scope="module")
+def _shared_health_db(request: pytest.FixtureRequest) -> HealthDB:
+    """Fixture for in-memory HealthDB instance shared across the module."""
+    db = HealthDB(Path(":memory:"), TEST_DB_CONFIG)
+    _enable_savepoints(db.engine)
+    # SQLAlchemy's per-engine compiled statement cache lives as long as this
+    # module-scoped engine, so no explicit compiled_cache is needed.
+    request.addfinalizer(db.engine.dispose)
+    return db
+
+
+@pytest.fixture(scope="module")
+def seeded_db(request: pytest.FixtureRequest) -> HealthDB:
+    """Fixture for a read-only HealthDB seeded once with a canonical dataset."""
+    db = HealthDB(Path(":memory:"), TEST_DB_CONFIG)
+    user_id = 1
+    start_date = date(2023, 1, 1)
+    end_date = date(2023, 1, 2)
+    _seed(
+        db,
+        (TimeSeries, [
+            {"user_id": user_id, "metric_type": MetricType.HEART_RATE.value,
+             "timestamp": TS_2023_01_01_12_00, "value": 80, "meta_data": {}},
+            {"user_id": user_id, "metric_type": MetricType.HEART_RATE.value,
+             "timestamp": TS_2023_01_01_12_01, "value": 82, "meta_data": {}},
+        ]),
+        (Activity, [
+            {"user_id": user_id, "activity_id": "1", "activity_date": start_date, "activity_name": "Running"},
+            {"user_id": user_id, "activity_id": "2", "activity_date": end_date, "activity_name": "Cycling"},
+        ]),
+        (DailyHealthMetric, [
+            {"user_id": user_id, "metric_date": start_date, "total_steps": 1000},
+            {"user_id": user_id, "metric_date": end_date, "total_steps": 2000},
+        ]),
+        (SyncStatus, [
+            {"user_id": user_id, "sync_date": start_date,
+             "metric_type": MetricType.HEART_RATE.value, "status": "pending"},
+            {"user_id": user_id, "sync_date": start_date,
+             "metric_type": MetricType.STEPS.value, "status": "success"},
+        ]),
+    )
+    request.addfinalizer(db.engine.dispose)
+    return db
 
 
 @pytest.fixture
-def db_path(tmp_path: Path) -> Path:
-    """Fixture for temporary database path."""
-    return tmp_path / "test_health.db"
+def health_db(_shared_health_db: HealthDB, monkeypatch: pytest.MonkeyPatch) -> HealthDB:
+    """Fixture for the shared HealthDB bound to a per-test transaction.
+
+    Commits issued by HealthDB release a SAVEPOINT instead of committing,
+    and the outer transaction is rolled back after each test.
+    """
+    connection = _shared_health_db.engine.connect()
+    transaction = connection.begin()
+    monkeypatch.setattr(_shared_health_db, "SessionLocal", sessionmaker(
+        bind=connection, join_transaction_mode="create_savepoint"
+    ))
+    yield _shared_health_db
+    transaction.rollback()
+    connection.close()
 
 
 @pytest.fixture
-def health_db(db_path: Path) -> HealthDB:
-    """Fixture for HealthDB instance."""
-    db = HealthDB(db_path)
-    yield db
-    db.engine.dispose()
+def db_session(health_db: HealthDB) -> Session:
+    """Fixture for a session joined to the per-test transaction."""
+    with health_db.get_session() as session:
+        yield session
 
 
-def test_initialization(health_db: HealthDB, db_path: Path):
+def test_initialization(tmp_path: Path):
     """Test database initialization."""
+    db_path = tmp_path / "test_health.db"
+    health_db = HealthDB(db_path, TEST_DB_CONFIG)
     assert db_path.exists()
     assert health_db.engine is not None
     assert health_db.SessionLocal is not None
-
-def test_get_session(health_db: HealthDB):
+    with health_db.engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+    health_db.engine.dispose()
+
+def test_connection_pragmas(db_session: Session):
+    """Test SQLite PRAGMAs applied from the database configuration."""
+    assert db_session.execute(text("PRAGMA synchronous")).scalar() == 0
+
+def test_default_connection_pragmas(tmp_path: Path):
+    """Test WAL and synchronous=NORMAL on a default-config database."""
+    health_db = HealthDB(tmp_path / "test_health.db")
+    with health_db.engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+    health_db.engine.dispose()
+
+def test_wal_mode_disabled(tmp_path: Path):
+    """Test that disabling WAL leaves the default journal mode."""
+    health_db = HealthDB(tmp_path / "test_health.db", DatabaseConfig(enable_wal_mode=False))
+    with health_db.engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+    health_db.engine.dispose()
+
+def test_invalid_synchronous_mode():
+    """Test that an unknown synchronous mode is rejected."""
+    with pytest.raises(ValueError, match="Invalid synchronous mode"):
+        HealthDB(Path(":memory:"), DatabaseConfig(synchronous="SOMETIMES"))
+
+def test_get_session(db_session: Session):
     """Test getting a database session."""
+    assert db_session is not None
+
+def test_in_memory_engine():
+    """Test that an in-memory database survives across sessions."""
+    health_db = HealthDB(Path(":memory:"), TEST_DB_CONFIG)
+    assert isinstance(health_db.engine.pool, StaticPool)
+    with health_db.get_session() as session:
+        session.add(SyncStatus(user_id=1, sync_date=date(2023, 1, 1),
+                               metric_type=MetricType.STEPS.value, status="pending"))
+        session.commit()
     with health_db.get_session() as session:
-        assert session is not None
+        assert session.scalar(select(func.count()).select_from(SyncStatus)) == 1
+    health_db.engine.dispose()
 
-def test_get_schema_info(health_db: HealthDB, db_path: Path):
-    """Test getting schema information."""
+def test_schema(health_db: HealthDB):
+    """Test getting schema information and validating the schema."""
+    tables = set(Base.metadata.tables.keys())
+    assert tables == {"timeseries", "activities", "daily_health_metrics", "sync_status"}
     schema_info = health_db.get_schema_info()
-    assert set(schema_info["tables"]) == {"timeseries", "activities", "daily_health_metrics", "sync_status"}
-    assert schema_info["db_path"] == str(db_path)
-
-def test_validate_schema(health_db: HealthDB):
-    """Test schema validation."""
+    assert set(schema_info["tables"]) == tables
+    assert schema_info["db_path"] == ":memory:"
     assert health_db.validate_schema()
 
-def test_store_timeseries_batch(health_db: HealthDB):
+@pytest.mark.parametrize("row_count", [2, 10_000])
+def test_store_timeseries_batch(health_db: HealthDB, db_session: Session, row_count: int):
     """Test storing a batch of timeseries data."""
     user_id = 1
     metric_type = MetricType.HEART_RATE
-    data = [
-        (datetime(2023, 1, 1, 12, 0, 0), 80, {}),
-        (datetime(2023, 1, 1, 12, 1, 0), 82, {}),
-    ]
+    data = [(TS_2023_01_01_12_00 + i, 80 + i % 40, {}) for i in range(row_count)]
     health_db.store_timeseries_batch(user_id, metric_type, data)
-    with health_db.get_session() as session:
-        timeseries = session.query(TimeSeries).all()
-        assert len(timeseries) == 2
-        assert timeseries[0].user_id == user_id
-        assert timeseries[0].metric_type == metric_type.value
+    assert db_session.scalar(select(func.count()).select_from(TimeSeries)) == row_count
+    row = db_session.execute(
+        select(TimeSeries.user_id, TimeSeries.metric_type).limit(1)
+    ).one()
+    assert row.user_id == user_id
+    assert row.metric_type == metric_type.value
+
+def test_store_timeseries_batch_upserts(health_db: HealthDB):
+    """Test that re-storing a timestamp replaces its value."""
+    user_id = 1
+    metric_type = MetricType.HEART_RATE
+    timestamp = TS_2023_01_01_12_00
+    health_db.store_timeseries_batch(user_id, metric_type, [(timestamp, 80, {})])
+    health_db.store_timeseries_batch(user_id, metric_type, [(timestamp, 90, {"source": "retry"})])
+    timeseries = health_db.get_timeseries(user_id, metric_type, timestamp, timestamp)
+    assert timeseries == [(timestamp, 90, {"source": "retry"})]
 
-def test_store_activity(health_db: HealthDB):
+def test_store_activity(health_db: HealthDB, db_session: Session):
     """Test storing activity data."""
     user_id = 1
     activity_data = {
@@ -70,23 +212,27 @@ def test_store_activity(health_db: HealthDB):
         "activity_name": "Running",
     }
     health_db.store_activity(user_id, activity_data)
-    with health_db.get_session() as session:
-        activity = session.query(Activity).first()
-        assert activity is not None
-        assert activity.user_id == user_id
-        assert activity.activity_id == "12345"
+    activity = db_session.execute(
+        select(Activity.user_id, Activity.activity_id).limit(1)
+    ).one()
+    assert activity.user_id == user_id
+    assert activity.activity_id == "12345"
 
-def test_store_health_metric(health_db: HealthDB):
+def test_store_health_metric(health_db: HealthDB, db_session: Session):
     """Test storing daily health metric data."""
     user_id = 1
     metric_date = date(2023, 1, 1)
     health_db.store_health_metric(user_id, metric_date, total_steps=1000)
-    with health_db.get_session() as session:
-        metric = session.query(DailyHealthMetric).first()
-        assert metric is not None
-        assert metric.user_id == user_id
-        assert metric.metric_date == metric_date
-        assert metric.total_steps == 1000
+    metric = db_session.execute(
+        select(
+            DailyHealthMetric.user_id,
+            DailyHealthMetric.metric_date,
+            DailyHealthMetric.total_steps,
+        ).limit(1)
+    ).one()
+    assert metric.user_id == user_id
+    assert metric.metric_date == metric_date
+    assert metric.total_steps == 1000
 
 def test_create_and_get_sync_status(health_db: HealthDB):
     """Test creating and getting sync status."""
@@ -109,20 +255,6 @@ def test_update_sync_status(health_db: HealthDB):
     status = health_db.get_sync_status(user_id, sync_date, metric_type)
     assert status == "success"
 
-def test_get_pending_metrics(health_db: HealthDB):
-    """Test getting pending metrics."""
-    user_id = 1
-    sync_date = date(2023, 1, 1)
-    health_db.create_sync_status(
-        user_id, sync_date, MetricType.HEART_RATE, "pending"
-    )
-    health_db.create_sync_status(
-        user_id, sync_date, MetricType.STEPS, "success"
-    )
-    pending_metrics = health_db.get_pending_metrics(user_id, sync_date)
-    assert len(pending_metrics) == 1
-    assert pending_metrics[0] == MetricType.HEART_RATE.value
-
 def test_existence_checks(health_db: HealthDB):
     """Test existence check methods."""
     user_id = 1
@@ -135,82 +267,89 @@ def test_existence_checks(health_db: HealthDB):
     assert not health_db.health_metric_exists(user_id, metric_date)
     assert not health_db.sync_status_exists(user_id, sync_date, metric_type)
 
-    health_db.store_activity(user_id, {"activity_id": activity_id, "activity_date": metric_date})
-    health_db.store_health_metric(user_id, metric_date)
-    health_db.create_sync_status(user_id, sync_date, metric_type)
+    _seed(
+        health_db,
+        (Activity, [{"user_id": user_id, "activity_id": activity_id, "activity_date": metric_date}]),
+        (DailyHealthMetric, [{"user_id": user_id, "metric_date": metric_date}]),
+        (SyncStatus, [{"user_id": user_id, "sync_date": sync_date,
+                       "metric_type": metric_type.value, "status": "pending"}]),
+    )
 
     assert health_db.activity_exists(user_id, activity_id)
     assert health_db.health_metric_exists(user_id, metric_date)
     assert health_db.sync_status_exists(user_id, sync_date, metric_type)
 
-def test_get_health_metrics(health_db: HealthDB):
-    """Test querying health metrics."""
-    user_id = 1
-    start_date = date(2023, 1, 1)
-    end_date = date(2023, 1, 2)
-    health_db.store_health_metric(user_id, start_date, total_steps=1000)
-    health_db.store_health_metric(user_id, end_date, total_steps=2000)
-
-    metrics = health_db.get_health_metrics(user_id, start_date, end_date)
-    assert len(metrics) == 2
-    assert metrics[0]["total_steps"] == 1000
-    assert metrics[1]["total_steps"] == 2000
-
-def test_get_activities(health_db: HealthDB):
-    """Test querying activities."""
-    user_id = 1
-    start_date = date(2023, 1, 1)
-    end_date = date(2023, 1, 2)
-    health_db.store_activity(
-        user_id, {"activity_id": "1", "activity_date": start_date, "activity_name": "Running"}
-    )
-    health_db.store_activity(
-        user_id, {"activity_id": "2", "activity_date": end_date, "activity_name": "Cycling"}
-    )
-
-    activities = health_db.get_activities(user_id, start_date, end_date)
-    assert len(activities) == 2
-    assert activities[0]["activity_name"] == "Running"
-    assert activities[1]["activity_name"] == "Cycling"
-
-def test_get_timeseries(health_db: HealthDB):
-    """Test querying timeseries data."""
+@pytest.mark.parametrize("query, expected", [
+    pytest.param(
+        lambda db: [
+            value for _, value, _ in db.get_timeseries(
+                1, MetricType.HEART_RATE, TS_2023_01_01_12_00, TS_2023_01_01_12_01
+            )
+        ],
+        [80, 82],
+        id="timeseries",
+    ),
+    pytest.param(
+        lambda db: [
+            activity["activity_name"]
+            for activity in db.get_activities(1, date(2023, 1, 1), date(2023, 1, 2))
+        ],
+        ["Running", "Cycling"],
+        id="activities",
+    ),
+    pytest.param(
+        lambda db: [
+            metric["total_steps"]
+            for metric in db.get_health_metrics(1, date(2023, 1, 1), date(2023, 1, 2))
+        ],
+        [1000, 2000],
+        id="metrics",
+    ),
+    pytest.param(
+        lambda db: db.get_pending_metrics(1, date(2023, 1, 1)),
+        [MetricType.HEART_RATE.value],
+        id="sync",
+    ),
+])
+def test_query(seeded_db: HealthDB, query, expected: list):
+    """Test querying timeseries, activities, health metrics and pending syncs."""
+    assert query(seeded_db) == expected
+
+def test_sync_activities_for_date_marks_completed(health_db: HealthDB):
+    """Test that syncing a date's activities marks ACTIVITIES as 'completed'."""
     user_id = 1
-    metric_type = MetricType.HEART_RATE
-    start_timestamp = int(datetime(2023, 1, 1, 12, 0, 0).timestamp())
-    end_timestamp = int(datetime(2023, 1, 1, 12, 1, 0).timestamp())
-    data = [
-        (start_timestamp, 80, {}),
-        (end_timestamp, 82, {}),
-    ]
-    health_db.store_timeseries_batch(user_id, metric_type, data)
-
-    timeseries = health_db.get_timeseries(
-        user_id, metric_type, start_timestamp, end_timestamp
-    )
-    assert len(timeseries) == 2
-    assert timeseries[0][1] == 80
-    assert timeseries[1][1] == 82
+    sync_date = date(2023, 1, 1)
+    _seed(health_db, (SyncStatus, [
+        {"user_id": user_id, "sync_date": sync_date,
+         "metric_type": MetricType.ACTIVITIES.value, "status": "pending"},
+    ]))
+    # Skip __init__, which would build its own HealthDB and extractor
+    sync_manager = SyncManager.__new__(SyncManager)
+    sync_manager.db = health_db
+    sync_manager.progress = ProgressReporter()
+    sync_manager.activities_iterator = SimpleNamespace(get_activities_for_date=lambda _: [])
+    stats = {'completed': 0, 'skipped': 0, 'failed': 0}
+
+    sync_manager._sync_activities_for_date(user_id, sync_date, stats)
+
+    assert stats['failed'] == 0
+    assert health_db.get_sync_status(user_id, sync_date, MetricType.ACTIVITIES) == "completed"
 
 @patch('garmy.AuthClient')
 @patch('garmy.APIClient')
 @patch('garmy.localdb.sync.ActivitiesIterator')
-def test_sync_activities_updates_status(mock_activities_iterator, mock_api_client, mock_auth_client, health_db: HealthDB):
+def test_sync_activities_updates_status(mock_activities_iterator, mock_api_client, mock_auth_client, tmp_path: Path):
     """Test that syncing activities updates their sync_status to 'completed'."""
-    from garmy.localdb.sync import SyncManager
-    from garmy.localdb.config import LocalDBConfig
-
     user_id = 1
     sync_date = date(2023, 1, 1)
 
     # Mock APIClient and ActivitiesIterator behavior
     mock_api_client_instance = mock_api_client.return_value
-    mock_api_client_instance.metrics.get.return_value.get.return_value = MagicMock() # For other metrics if any
 
     mock_activities_iterator_instance = mock_activities_iterator.return_value
     mock_activities_iterator_instance.get_activities_for_date.return_value = [
-        MagicMock(activity_id="123", activity_date=sync_date, activity_name="Running"),
-        MagicMock(activity_id="456", activity_date=sync_date, activity_name="Walking")
+        SimpleNamespace(activity_id="123", activity_date=sync_date, activity_name="Running"),
+        SimpleNamespace(activity_id="456", activity_date=sync_date, activity_name="Walking")
     ]
     mock_activities_iterator_instance.initialize.return_value = None
 
@@ -223,7 +362,7 @@ def test_sync_activities_updates_status(mock_activities_iterator, mock_api_clien
         ]
 
         # Initialize SyncManager
-        sync_manager = SyncManager(db_path=health_db.db_path, config=LocalDBConfig())
+        sync_manager = SyncManager(db_path=tmp_path / "sync_health.db", config=LocalDBConfig())
         sync_manager.api_client = mock_api_client_instance
         sync_manager.activities_iterator = mock_activities_iterator_instance
 
@@ -231,6 +370,6 @@ def test_sync_activities_updates_status(mock_activities_iterator, mock_api_clien
         sync_manager.sync_range(user_id, sync_date, sync_date, metrics=[MetricType.ACTIVITIES])
 
         # Assert that the sync status for ACTIVITIES is 'completed'
-        status = health_db.get_sync_status(user_id, sync_date, MetricType.ACTIVITIES)
+        status = sync_manager.db.get_sync_status(user_id, sync_date, MetricType.ACTIVITIES)
         assert status == 'completed'
 